@@ -1,6 +1,6 @@
 # app/database.py
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -9,11 +9,42 @@ import os
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(BASE_DIR, "scoutingplanner.db")
 SQLALCHEMY_DATABASE_URL = f"sqlite:///{DB_PATH}"
+# URL de la réplica de lectura. Si no se define, las lecturas usan un segundo
+# pool de conexiones sobre la misma BD abierto en modo solo lectura.
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL") or SQLALCHEMY_DATABASE_URL
+# Tras una escritura, las lecturas de ese cliente van al primario durante este
+# tiempo para que vea sus propios cambios aunque la réplica vaya con retraso.
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+
+def _make_engine(url: str, read_only: bool = False):
+    if not url.startswith("sqlite"):
+        connect_args = {}
+        if read_only and url.startswith("postgresql"):
+            connect_args = {"options": "-c default_transaction_read_only=on"}
+        elif read_only and url.startswith("mysql"):
+            connect_args = {"init_command": "SET SESSION TRANSACTION READ ONLY"}
+        elif read_only:
+            raise ValueError(f"No se puede abrir en solo lectura: {url.split(':', 1)[0]}")
+        return create_engine(url, pool_pre_ping=True, connect_args=connect_args)
+    sqlite_engine = create_engine(url, connect_args={"check_same_thread": False})
+
+    @event.listens_for(sqlite_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # WAL permite que los lectores no bloqueen al escritor (y viceversa)
+        cursor.execute("PRAGMA journal_mode=WAL")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+    return sqlite_engine
+
+
+engine = _make_engine(SQLALCHEMY_DATABASE_URL)
+read_engine = _make_engine(READ_DATABASE_URL, read_only=True)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 Base = declarative_base()
 
 def init_db():
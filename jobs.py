@@ -0,0 +1,255 @@
+# app/jobs.py
+#
+# Cola local de trabajos en segundo plano. Los trabajos se guardan en la tabla
+# `jobs`, un pool de hilos los ejecuta y el endpoint que los crea responde
+# 202 de inmediato; el cliente consulta estado/progreso en /jobs/{id}.
+
+import csv
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from pydantic import ValidationError
+from sqlalchemy import or_
+
+from . import database
+from .models import Job, User, Profile
+from .schemas import UserCreate
+
+try:
+    import PIL  # noqa: F401  (dependencia opcional, solo para resize_photo)
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+RETRY_DELAY_SECONDS = 5
+JOB_HEARTBEAT_SECONDS = int(os.getenv("JOB_HEARTBEAT_SECONDS", "30"))
+# Un trabajo "running" sin latido desde hace esto se da por huérfano (proceso caído)
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "300"))
+RESULTS_DIR = os.path.join(database.BASE_DIR, "job_results")
+UPLOADS_DIR = os.path.join(RESULTS_DIR, "uploads")
+
+os.makedirs(UPLOADS_DIR, exist_ok=True)
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job-worker")
+HANDLERS = {}
+
+
+class PermanentJobError(Exception):
+    """Error que no tiene sentido reintentar: el trabajo pasa directo a failed."""
+
+
+def job_handler(kind: str):
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(db, kind: str, payload: dict | None = None, owner_id: int | None = None,
+            max_attempts: int = 3) -> Job:
+    if kind not in HANDLERS:
+        raise ValueError(f"Tipo de trabajo desconocido: {kind}")
+    job = Job(kind=kind, payload=json.dumps(payload or {}), owner_id=owner_id,
+              max_attempts=max_attempts)
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    _executor.submit(_run, job.id)
+    return job
+
+
+def recover_jobs():
+    """Reencola los trabajos que quedaron a medias si el proceso se reinició."""
+    db = database.SessionLocal()
+    try:
+        # Solo los "running" huérfanos: con varios procesos, otro worker puede
+        # estar ejecutándolos ahora mismo y seguirá renovando heartbeat_at.
+        stale_before = datetime.utcnow() - timedelta(seconds=JOB_STALE_SECONDS)
+        db.query(Job).filter(
+            Job.status == "running",
+            or_(Job.heartbeat_at.is_(None), Job.heartbeat_at < stale_before),
+        ).update({"status": "pending"}, synchronize_session=False)
+        db.commit()
+        ids = [job_id for (job_id,) in db.query(Job.id).filter(Job.status == "pending")]
+    finally:
+        db.close()
+    for job_id in ids:
+        _executor.submit(_run, job_id)
+
+
+def _touch(job_id: int, **values):
+    # Sesión aparte para no confirmar a medias lo que el handler tenga pendiente
+    db = database.SessionLocal()
+    try:
+        values["heartbeat_at"] = datetime.utcnow()
+        db.query(Job).filter(Job.id == job_id).update(values, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _heartbeat(job_id: int, stop: threading.Event):
+    while not stop.wait(JOB_HEARTBEAT_SECONDS):
+        _touch(job_id)
+
+
+def _discard_upload(payload: dict):
+    # Los archivos subidos solo sirven al trabajo; sin más reintentos se borran
+    path = payload.get("path")
+    if path and os.path.commonpath([UPLOADS_DIR, os.path.abspath(path)]) == UPLOADS_DIR:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _run(job_id: int):
+    db = database.SessionLocal()
+    try:
+        # Reclamo atómico: si otro worker ya lo tomó, rowcount es 0
+        now = datetime.utcnow()
+        claimed = db.query(Job).filter(Job.id == job_id, Job.status == "pending").update(
+            {"status": "running", "attempts": Job.attempts + 1,
+             "started_at": now, "heartbeat_at": now, "error": None},
+            synchronize_session=False,
+        )
+        db.commit()
+        if not claimed:
+            return
+        job = db.query(Job).filter(Job.id == job_id).first()
+        payload = json.loads(job.payload or "{}")
+
+        def set_progress(value: int):
+            _touch(job_id, progress=max(0, min(100, int(value))))
+
+        stop = threading.Event()
+        threading.Thread(target=_heartbeat, args=(job_id, stop), daemon=True).start()
+        try:
+            result_path = HANDLERS[job.kind](db, job, payload, set_progress)
+        except Exception as exc:
+            db.rollback()
+            job.error = str(exc) or exc.__class__.__name__
+            if isinstance(exc, PermanentJobError) or job.attempts >= job.max_attempts:
+                job.status = "failed"
+                job.finished_at = datetime.utcnow()
+                db.commit()
+                _discard_upload(payload)
+            else:
+                job.status = "pending"
+                db.commit()
+                timer = threading.Timer(RETRY_DELAY_SECONDS * job.attempts, _executor.submit, (_run, job_id))
+                timer.daemon = True
+                timer.start()
+            return
+        finally:
+            stop.set()
+        job.result_path = result_path
+        job.status = "succeeded"
+        job.progress = 100
+        job.finished_at = datetime.utcnow()
+        db.commit()
+    finally:
+        db.close()
+
+
+# -----------------------
+# HANDLERS
+# -----------------------
+
+@job_handler("export_users")
+def export_users(db, job, payload, set_progress):
+    total = db.query(User).count() or 1
+    path = os.path.join(RESULTS_DIR, f"job_{job.id}_usuarios.csv")
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "email", "role", "nombre", "apellido", "telefono",
+                         "grupo_scout", "comunidad", "departamento", "distrito"])
+        rows = (
+            db.query(User, Profile)
+            .outerjoin(Profile, Profile.user_id == User.id)
+            .order_by(User.id)
+            .yield_per(500)
+        )
+        for i, (user, profile) in enumerate(rows, start=1):
+            writer.writerow([
+                user.id, user.email, user.role,
+                *(getattr(profile, field, None) for field in (
+                    "nombre", "apellido", "telefono", "grupo_scout",
+                    "comunidad", "departamento", "distrito",
+                )),
+            ])
+            if i % 500 == 0:
+                set_progress(i * 100 // total)
+    return path
+
+
+def _import_user_row(db, row, email, existing):
+    password = row.get("password") or ""
+    if not email or not password:
+        return "faltan email o password"
+    try:
+        # Mismas validaciones que /auth/register y POST /users
+        user_in = UserCreate(email=email, password=password,
+                             role=(row.get("role") or "").strip() or "caminante")
+    except ValidationError:
+        return "email no válido"
+    if user_in.email in existing:
+        return "email ya registrado"
+    db.add(User(email=user_in.email, hashed_password=user_in.password, role=user_in.role))
+    existing.add(user_in.email)
+    return "creado"
+
+
+@job_handler("import_users")
+def import_users(db, job, payload, set_progress):
+    source = payload.get("path")
+    if not source or not os.path.exists(source):
+        raise PermanentJobError("Archivo de importación no encontrado")
+    try:
+        with open(source, newline="", encoding="utf-8-sig") as f:
+            rows = list(csv.DictReader(f))
+    except (UnicodeDecodeError, csv.Error) as exc:
+        # Reintentar no arregla un archivo mal codificado o mal formado
+        raise PermanentJobError(f"CSV no válido (se espera UTF-8): {exc}")
+    existing = {email for (email,) in db.query(User.email)}
+    path = os.path.join(RESULTS_DIR, f"job_{job.id}_importacion.csv")
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["fila", "email", "resultado"])
+        # Todo o nada: los usuarios se confirman al final, así un reintento
+        # parte de cero y el archivo de resultado refleja un único intento.
+        for i, row in enumerate(rows, start=1):
+            email = (row.get("email") or "").strip()
+            writer.writerow([i, email, _import_user_row(db, row, email, existing)])
+            if i % 200 == 0:
+                set_progress(i * 100 // len(rows))
+        db.commit()
+    os.remove(source)
+    return path
+
+
+@job_handler("resize_photo")
+def resize_photo(db, job, payload, set_progress):
+    try:
+        from PIL import Image
+    except ImportError:
+        raise PermanentJobError("Pillow no está instalado; no se puede redimensionar la imagen")
+    path = payload.get("path")
+    if not path or not os.path.exists(path):
+        raise PermanentJobError("Imagen no encontrada")
+    max_size = int(payload.get("max_size", 800))
+    # Se escribe aparte y se reemplaza de golpe: /static nunca sirve una imagen
+    # a medio escribir y, si falla, el original queda intacto para el reintento.
+    tmp_path = f"{path}.job{job.id}.tmp"
+    try:
+        with Image.open(path) as img:
+            img_format = img.format
+            img.thumbnail((max_size, max_size))
+            img.save(tmp_path, format=img_format)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return None
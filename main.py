@@ -1,5 +1,6 @@
 import os
 import shutil
+import time
 from datetime import datetime, timedelta, date
 from typing import List, Optional
 from fastapi import FastAPI
@@ -7,29 +8,32 @@ from fastapi import FastAPI
 
 from fastapi import (
     FastAPI, Depends, HTTPException, status,
-    UploadFile, File, Form, Body
+    UploadFile, File, Form, Body, Request
 )
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
 from sqlalchemy.orm import Session
 from jose import JWTError, jwt
 
-from . import models, schemas, database
-from .models import User, Profile, ScoutGroup, Team, Membership, Appearance
+from . import models, schemas, database, jobs
+from .models import User, Profile, ScoutGroup, Team, Membership, Appearance, Job
 from .schemas import (
     UserRead, UserCreate, UserUpdate, Token,
     ProfileRead, ProfileCreate, ProfileUpdate,
     ScoutGroupRead, ScoutGroupCreate, ScoutGroupUpdate,
     TeamRead, TeamCreate, TeamUpdate,
     MembershipRead, MembershipCreate,
-    AppearanceRead, AppearanceUpdate
+    AppearanceRead, AppearanceUpdate,
+    JobRead
 )
 
 # Configuración de seguridad
 SECRET_KEY = "cambia_esto_por_una_clave_muy_segura"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
+READ_PRIMARY_COOKIE = "read_primary_until"
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
@@ -52,6 +56,7 @@ app.add_middleware(
 app.mount("/static", StaticFiles(directory="static"), name="static")
 os.makedirs("static/photos", exist_ok=True)
 database.init_db()
+jobs.recover_jobs()
 
 def get_db():
     db = database.SessionLocal()
@@ -60,31 +65,85 @@ def get_db():
     finally:
         db.close()
 
+def wrote_recently(request: Request) -> bool:
+    try:
+        until = float(request.cookies.get(READ_PRIMARY_COOKIE, "0"))
+    except ValueError:
+        return False
+    # Se acota al máximo configurado por si el cliente manipula la cookie
+    return time.time() < until <= time.time() + database.READ_YOUR_WRITES_SECONDS
+
+def get_read_db(request: Request):
+    # Lecturas a la réplica, salvo justo después de una escritura del mismo cliente
+    if wrote_recently(request):
+        db = database.SessionLocal()
+    else:
+        db = database.ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+@app.middleware("http")
+async def track_writes(request: Request, call_next):
+    # La marca viaja con el cliente (cookie), así funciona con varios procesos
+    response = await call_next(request)
+    if request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        seconds = database.READ_YOUR_WRITES_SECONDS
+        response.set_cookie(
+            READ_PRIMARY_COOKIE, str(time.time() + seconds),
+            max_age=int(seconds) + 1, httponly=True, samesite="lax",
+        )
+    return response
+
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-):
-    credentials_error = HTTPException(
+def credentials_error():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="No se pudo validar las credenciales",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def get_token_email(token: str = Depends(oauth2_scheme)) -> str:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
         if email is None:
-            raise credentials_error
+            raise credentials_error()
     except JWTError:
-        raise credentials_error
+        raise credentials_error()
+    return email
+
+def get_current_user(
+    email: str = Depends(get_token_email),
+    db: Session = Depends(get_db)
+):
     user = db.query(User).filter(User.email == email).first()
     if not user:
-        raise credentials_error
+        raise credentials_error()
+    return user
+
+def get_current_user_read(
+    email: str = Depends(get_token_email),
+    db: Session = Depends(get_read_db)
+):
+    # Para endpoints GET: misma sesión que get_read_db. Si la réplica aún no
+    # tiene al usuario (recién creado), se consulta el primario. Los cambios de
+    # rol pueden tardar en aplicarse lo que tarde la réplica en replicar.
+    user = db.query(User).filter(User.email == email).first()
+    if not user:
+        primary = database.SessionLocal()
+        try:
+            user = primary.query(User).filter(User.email == email).first()
+        finally:
+            primary.close()
+    if not user:
+        raise credentials_error()
     return user
 
 # -----------------------
@@ -116,17 +175,17 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
 # -----------------------
 
 @app.get("/users/me", response_model=UserRead, tags=["users"])
-def read_users_me(current_user: User = Depends(get_current_user)):
+def read_users_me(current_user: User = Depends(get_current_user_read)):
     return current_user
 
 @app.get("/users", response_model=List[UserRead], tags=["users"])
-def list_users(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def list_users(current_user: User = Depends(get_current_user_read), db: Session = Depends(get_read_db)):
     if current_user.role != "administrador":
         raise HTTPException(status_code=403, detail="Solo administradores pueden listar usuarios.")
     return db.query(User).all()
 
 @app.get("/users/{user_id}", response_model=UserRead, tags=["users"])
-def get_user(user_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_user(user_id: int, current_user: User = Depends(get_current_user_read), db: Session = Depends(get_read_db)):
     if current_user.role != "administrador":
         raise HTTPException(status_code=403, detail="Solo administradores pueden ver usuarios.")
     user = db.query(User).filter(User.id == user_id).first()
@@ -184,7 +243,7 @@ def delete_user(user_id: int, current_user: User = Depends(get_current_user), db
 # -----------------------
 
 @app.get("/users/me/profile", response_model=ProfileRead, tags=["profile"])
-def read_my_profile(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def read_my_profile(current_user: User = Depends(get_current_user_read), db: Session = Depends(get_read_db)):
     profile = db.query(Profile).filter(Profile.user_id == current_user.id).first()
     if not profile:
         raise HTTPException(status_code=404, detail="Perfil no encontrado")
@@ -230,6 +289,9 @@ async def upsert_my_profile(
         # Devuelve una URL absoluta para la foto:
         profile.foto_url = f"{os.getenv('BACKEND_URL') or 'http://localhost:8000'}/static/photos/{filename}"
     db.commit()
+    if foto and jobs.PIL_AVAILABLE:
+        # El redimensionado se hace en segundo plano para no alargar la petición
+        jobs.enqueue(db, "resize_photo", {"path": file_path}, owner_id=current_user.id)
     db.refresh(profile)
     return profile
 
@@ -238,7 +300,7 @@ async def upsert_my_profile(
 # -----------------------
 
 @app.get("/appearance", response_model=AppearanceRead, tags=["appearance"])
-def get_appearance(db: Session = Depends(get_db)):
+def get_appearance(db: Session = Depends(get_read_db)):
     appearance = db.query(Appearance).first()
     if not appearance:
         # Valor por defecto si no existe registro
@@ -265,6 +327,8 @@ async def update_appearance(
         appearance = Appearance(portada_url=portada_url)
         db.add(appearance)
     db.commit()
+    if jobs.PIL_AVAILABLE:
+        jobs.enqueue(db, "resize_photo", {"path": file_path}, owner_id=current_user.id)
     db.refresh(appearance)
     return appearance
 
@@ -273,7 +337,7 @@ async def update_appearance(
 # -----------------------
 
 @app.get("/scout-groups", response_model=List[ScoutGroupRead], tags=["scout-groups"])
-def list_scout_groups(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def list_scout_groups(current_user: User = Depends(get_current_user_read), db: Session = Depends(get_read_db)):
     if current_user.role != "administrador":
         raise HTTPException(status_code=403, detail="Sin permiso para ver grupos scout")
     return db.query(ScoutGroup).all()
@@ -331,8 +395,8 @@ def delete_scout_group(
 
 @app.get("/teams", response_model=List[TeamRead], tags=["teams"])
 def list_teams(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_read),
+    db: Session = Depends(get_read_db)
 ):
     if current_user.role == "administrador":
         return db.query(Team).all()
@@ -386,8 +450,8 @@ def delete_team(
 
 @app.get("/memberships", response_model=List[MembershipRead], tags=["memberships"])
 def list_memberships(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_read),
+    db: Session = Depends(get_read_db)
 ):
     if current_user.role == "administrador":
         return db.query(Membership).all()
@@ -427,6 +491,56 @@ def delete_membership(
     db.commit()
     return {"ok": True}
 
+# -----------------------
+# TRABAJOS EN SEGUNDO PLANO
+# -----------------------
+
+def get_job_or_404(job_id: int, current_user: User, db: Session) -> Job:
+    job = db.query(Job).filter(Job.id == job_id).first()
+    if not job or (current_user.role != "administrador" and job.owner_id != current_user.id):
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return job
+
+@app.post("/jobs/exports/users", response_model=JobRead, status_code=status.HTTP_202_ACCEPTED, tags=["jobs"])
+def export_users(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    if current_user.role != "administrador":
+        raise HTTPException(status_code=403, detail="Solo administradores pueden exportar usuarios.")
+    return jobs.enqueue(db, "export_users", owner_id=current_user.id)
+
+@app.post("/jobs/imports/users", response_model=JobRead, status_code=status.HTTP_202_ACCEPTED, tags=["jobs"])
+async def import_users(
+    archivo: UploadFile = File(...),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    if current_user.role != "administrador":
+        raise HTTPException(status_code=403, detail="Solo administradores pueden importar usuarios.")
+    # El archivo se guarda en disco porque el UploadFile se cierra al terminar la petición
+    file_path = os.path.join(jobs.UPLOADS_DIR, f"{datetime.utcnow():%Y%m%d%H%M%S%f}_{current_user.id}.csv")
+    with open(file_path, "wb") as buffer:
+        shutil.copyfileobj(archivo.file, buffer)
+    return jobs.enqueue(db, "import_users", {"path": file_path}, owner_id=current_user.id)
+
+@app.get("/jobs", response_model=List[JobRead], tags=["jobs"])
+def list_jobs(current_user: User = Depends(get_current_user_read), db: Session = Depends(get_read_db)):
+    query = db.query(Job)
+    if current_user.role != "administrador":
+        query = query.filter(Job.owner_id == current_user.id)
+    return query.order_by(Job.id.desc()).limit(100).all()
+
+@app.get("/jobs/{job_id}", response_model=JobRead, tags=["jobs"])
+def get_job(job_id: int, current_user: User = Depends(get_current_user_read), db: Session = Depends(get_read_db)):
+    return get_job_or_404(job_id, current_user, db)
+
+@app.get("/jobs/{job_id}/result", tags=["jobs"])
+def get_job_result(job_id: int, current_user: User = Depends(get_current_user_read), db: Session = Depends(get_read_db)):
+    job = get_job_or_404(job_id, current_user, db)
+    if job.status != "succeeded":
+        raise HTTPException(status_code=409, detail="El trabajo aún no ha terminado correctamente")
+    if not job.result_path or not os.path.exists(job.result_path):
+        raise HTTPException(status_code=404, detail="Este trabajo no tiene archivo de resultado")
+    return FileResponse(job.result_path, filename=os.path.basename(job.result_path))
+
 # -----------------------
 # ENDPOINT DE TEST
 # -----------------------
@@ -1,6 +1,8 @@
 # app/models.py
 
-from sqlalchemy import Column, Integer, String, Date, ForeignKey, Text
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, Text
 from sqlalchemy.orm import relationship
 from .database import Base
 
@@ -90,6 +92,28 @@ class Membership(Base):
     team_id = Column(Integer, ForeignKey("teams.id"))
     perfil_id = Column(Integer, ForeignKey("profiles.id"))
 
+# ---------------------------
+# TRABAJOS EN SEGUNDO PLANO (exportaciones, importaciones, imágenes...)
+# ---------------------------
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False, index=True)
+    # pending -> running -> succeeded / failed (vuelve a pending si se reintenta)
+    status = Column(String, default="pending", nullable=False, index=True)
+    progress = Column(Integer, default=0, nullable=False)
+    payload = Column(Text, nullable=True)  # JSON con los parámetros del trabajo
+    result_path = Column(String, nullable=True)
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    max_attempts = Column(Integer, default=3, nullable=False)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)  # lo renueva el worker mientras corre
+    finished_at = Column(DateTime, nullable=True)
+
 # ---------------------------
 # Puedes seguir agregando aquí los modelos para Logros, Challenges, Ciclos, etc.
 # Si necesitas que los incluya, dímelo antes de seguir con los endpoints.
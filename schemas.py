@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr
 from typing import Optional, List
-from datetime import date
+from datetime import date, datetime
 
 # ----------- USUARIOS -----------
 class UserBase(BaseModel):
@@ -117,6 +117,21 @@ class AppearanceRead(AppearanceBase):
     class Config:
         from_attributes = True
 
+# ----------- TRABAJOS EN SEGUNDO PLANO -----------
+class JobRead(BaseModel):
+    id: int
+    kind: str
+    status: str
+    progress: int
+    attempts: int
+    max_attempts: int
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    class Config:
+        from_attributes = True
+
 # ----------- TOKEN (LOGIN) -----------
 class Token(BaseModel):
     access_token: str